@@ -1,4 +1,36 @@
+from __future__ import annotations
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
 
-from .compiler import Compiler, compile_figure, compile_payload
-from .plotly_builder import PlotlyFigureBuilder
-from .io_utils import figure_to_json_dict, json_dict_to_figure, write_html, to_image_bytes
+# Public names resolve lazily (PEP 562): importing the package does not pull in
+# plotly/pandas until something is actually used.
+_EXPORTS = {
+    "Compiler": ".compiler",
+    "compile_figure": ".compiler",
+    "compile_payload": ".compiler",
+    "compile_payload_bytes": ".compiler",
+    "PlotlyFigureBuilder": ".plotly_builder",
+    "figure_to_json_dict": ".io_utils",
+    "json_dict_to_figure": ".io_utils",
+    "write_html": ".io_utils",
+    "fast_write_html": ".io_utils",
+    "to_image_bytes": ".io_utils",
+}
+
+__all__ = list(_EXPORTS)
+
+if TYPE_CHECKING:
+    from .compiler import Compiler, compile_figure, compile_payload, compile_payload_bytes
+    from .plotly_builder import PlotlyFigureBuilder
+    from .io_utils import figure_to_json_dict, json_dict_to_figure, write_html, fast_write_html, to_image_bytes
+
+def __getattr__(name: str) -> Any:
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
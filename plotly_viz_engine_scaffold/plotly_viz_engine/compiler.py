@@ -1,32 +1,60 @@
-
 from __future__ import annotations
-from typing import Dict, Any, Optional
-import json
+from typing import TYPE_CHECKING, Dict, Any, Optional
+from functools import lru_cache
 
+import orjson
 import pandas as pd
-import plotly.graph_objects as go
 
 from pydantic_viz_spec import VizSpec
-from .plotly_builder import PlotlyFigureBuilder
-from .io_utils import figure_to_json_dict
+from .plotly_builder import PlotlyFigureBuilder, _build_traces_as_dicts, _hydrate_layout, _compile_impl
+from .io_utils import to_json_bytes
+
+# plotly is imported lazily: the payload path only needs plotly.io for templates.
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
 
 class Compiler:
-    """Director that composes the builder steps. Keep it tiny and deterministic."""
+    """Tiny and deterministic; runs the builder chain only if a custom builder is injected."""
     def __init__(self, figure_builder: Optional[PlotlyFigureBuilder] = None):
-        self.builder = figure_builder or PlotlyFigureBuilder()
+        self.builder = figure_builder
 
     def compile(self, df: pd.DataFrame, spec: VizSpec) -> go.Figure:
-        return self.builder.start().bind_data(df).apply_spec(spec).build()
+        if self.builder is not None:
+            return self.builder.start().bind_data(df).apply_spec(spec).build()
+        return _compile_impl(df, spec)
+
+# Stateless without an injected builder, so one shared instance is safe across calls/threads.
+_DEFAULT = Compiler()
 
 def compile_figure(df: pd.DataFrame, spec: VizSpec) -> go.Figure:
-    return Compiler().compile(df, spec)
+    return _DEFAULT.compile(df, spec)
 
 def compile_payload(df: pd.DataFrame, spec: VizSpec) -> Dict[str, Any]:
     """Return JSON-safe payload containing the figure dict + plotly_config + viz_spec_version."""
-    fig = compile_figure(df, spec)
-    payload = {
-        "figure": figure_to_json_dict(fig),
+    return orjson.loads(compile_payload_bytes(df, spec))
+
+def compile_payload_bytes(df: pd.DataFrame, spec: VizSpec) -> bytes:
+    """Same payload as compile_payload, serialized once to JSON bytes (no dict round trip)."""
+    return to_json_bytes({
+        "figure": _figure_dict(df, spec),
         "plotly_config": (spec.plotly_config.model_dump() if spec.plotly_config else {}),
         "viz_spec_version": spec.version,
-    }
-    return payload
+    })
+
+
+# ---------- JSON fast path (no go.Figure, no validators) ----------
+
+def _figure_dict(df: pd.DataFrame, spec: VizSpec) -> Dict[str, Any]:
+    import plotly.io as pio
+    layout = _hydrate_layout(spec)
+    # go.Figure would expand the template name (or the default) into the full template.
+    template = layout.get("template", pio.templates.default)
+    if isinstance(template, str):
+        layout["template"] = orjson.loads(_template_json(template))
+    return {"data": _build_traces_as_dicts(df, spec), "layout": layout}
+
+@lru_cache(maxsize=32)
+def _template_json(name: str) -> bytes:
+    # Cached as bytes so every payload gets its own (cheaply parsed) copy.
+    import plotly.io as pio
+    return to_json_bytes(pio.templates[name].to_plotly_json())
@@ -1,23 +1,110 @@
-
 from __future__ import annotations
-from typing import Dict, Any, Optional
-import json
+from typing import TYPE_CHECKING, Dict, Any, Optional
+import uuid
+from decimal import Decimal
+
+import numpy as np
+import orjson
+import pandas as pd
+
+# plotly is imported inside the functions that need it (cold-start cost).
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
+_ORJSON_OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+def _orjson_default(obj: Any) -> Any:
+    # orjson falls through here for object-dtype arrays and pandas/numpy scalars
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if obj is pd.NaT or obj is pd.NA:
+        return None
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
 
-import plotly.graph_objects as go
-import plotly.io as pio
+def _nat_safe(obj: Any) -> Any:
+    # orjson rejects NaT inside datetime64 arrays and never hands them to the
+    # default hook; as datetime objects NaT becomes None (-> null).
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.kind == "M" and np.isnat(obj).any():
+            return obj.astype("datetime64[us]").astype(object)
+        return obj
+    if isinstance(obj, dict):
+        return {k: _nat_safe(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_nat_safe(v) for v in obj]
+    return obj
+
+def to_json_bytes(obj: Any) -> bytes:
+    """Serialize plotly-style dicts (ndarrays, timestamps, NaN/NaT) straight to JSON bytes."""
+    try:
+        return orjson.dumps(obj, default=_orjson_default, option=_ORJSON_OPTS)
+    except orjson.JSONEncodeError:
+        # Rare path: only NaT-bearing datetime arrays need the rewrite walk.
+        return orjson.dumps(_nat_safe(obj), default=_orjson_default, option=_ORJSON_OPTS)
 
 def figure_to_json_dict(fig: go.Figure) -> Dict[str, Any]:
     # ensure clean JSON-serializable dict (no numpy types etc.)
-    return json.loads(pio.to_json(fig))
+    return orjson.loads(to_json_bytes(fig.to_plotly_json()))
 
 def json_dict_to_figure(d: Dict[str, Any]) -> go.Figure:
-    return pio.from_json(json.dumps(d))
+    import plotly.io as pio
+    return pio.from_json(to_json_bytes(d).decode())
 
 def write_html(fig: go.Figure, path: str, *, include_plotlyjs: str = "cdn", full_html: bool = True) -> None:
+    if include_plotlyjs == "cdn" and full_html:
+        fast_write_html(fig, path)
+        return
+    import plotly.io as pio
     pio.write_html(fig, path, include_plotlyjs=include_plotlyjs, full_html=full_html)
 
+# Page split around the two JSON blobs so they can be written as bytes, never joined.
+_HTML_HEAD = """<html>
+<head><meta charset="utf-8" /></head>
+<body>
+    <div id="%(div_id)s" class="plotly-graph-div" style="height:100%%; width:100%%;"></div>
+    <script charset="utf-8" src="https://cdn.plot.ly/plotly-%(plotlyjs_version)s.min.js"></script>
+    <script type="text/javascript">
+        window.PLOTLYENV=window.PLOTLYENV || {};
+        Plotly.newPlot("%(div_id)s", """
+_HTML_TAIL = b""", {"responsive": true});
+    </script>
+</body>
+</html>
+"""
+
+# Same escaping plotly applies to JSON embedded in <script> (no "</script>" breakout).
+_HTML_UNSAFE = (
+    (b"<", b"\\u003c"), (b">", b"\\u003e"), (b"/", b"\\u002f"),
+    ("\u2028".encode(), b"\\u2028"), ("\u2029".encode(), b"\\u2029"),
+)
+
+def _html_safe(b: bytes) -> bytes:
+    for unsafe, safe in _HTML_UNSAFE:
+        if unsafe in b:
+            b = b.replace(unsafe, safe)
+    return b
+
+def fast_write_html(fig: go.Figure, path: str) -> None:
+    """Write a standalone CDN-backed HTML page, bypassing pio.write_html's template + encoder."""
+    from plotly.offline import get_plotlyjs_version
+    fig_dict = fig.to_plotly_json()
+    head = _HTML_HEAD % {"div_id": uuid.uuid4(), "plotlyjs_version": get_plotlyjs_version()}
+    with open(path, "wb") as f:
+        f.write(head.encode())
+        f.write(_html_safe(to_json_bytes(fig_dict.get("data", []))))
+        f.write(b", ")
+        f.write(_html_safe(to_json_bytes(fig_dict.get("layout", {}))))
+        f.write(_HTML_TAIL)
+
 def to_image_bytes(fig: go.Figure, *, format: str = "png", scale: float = 2.0) -> Optional[bytes]:
     """Return image bytes if kaleido is available; otherwise return None."""
+    import plotly.io as pio
     try:
         return pio.to_image(fig, format=format, scale=scale)
     except Exception:
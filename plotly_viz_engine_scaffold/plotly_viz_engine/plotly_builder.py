@@ -1,48 +1,48 @@
 
 from __future__ import annotations
-from typing import List, Dict, Callable, Optional, Any
-from dataclasses import dataclass
+from typing import TYPE_CHECKING, List, Dict, Callable, Optional, Any
+import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
 
 # Import your VizSpec models from the uploaded file (assumed in PYTHONPATH)
 from pydantic_viz_spec import (
-    VizSpec, ChartType, Mode, Orientation, BarMode, HistNorm, LineShape,
+    VizSpec, ChartType, Mode, Orientation, BarMode, HistNorm, LineShape, EncodingsSpec,
 )
 
-TraceFactory = Callable[[pd.DataFrame, VizSpec], List[go.BaseTraceType]]
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
 
-@dataclass
-class _State:
-    df: Optional[pd.DataFrame] = None
-    spec: Optional[VizSpec] = None
-    traces: Optional[List[go.BaseTraceType]] = None
-    layout: Dict[str, Any] = None
+# Factories emit plain plotly trace dicts ({"type": "scatter", ...}); go.Figure validates
+# them in a single constructor call, the JSON path serializes them as-is.
+TraceFactory = Callable[[pd.DataFrame, VizSpec], List[Dict[str, Any]]]
+
+def _compile_impl(df: pd.DataFrame, spec: VizSpec) -> go.Figure:
+    """Pure DataFrame + VizSpec -> Figure; the whole go.Figure path in one call."""
+    import plotly.graph_objects as go
+    # One validating pass over data + layout; no intermediate trace objects.
+    return go.Figure({"data": _build_traces_as_dicts(df, spec), "layout": _hydrate_layout(spec)})
 
 class PlotlyFigureBuilder:
-    """Concrete builder that consumes a VizSpec + DataFrame and produces a plotly.graph_objects.Figure."""
+    """Deprecated fluent wrapper (start/bind_data/apply_spec/build) over _compile_impl; kept for existing callers."""
     def __init__(self):
-        self._s = _State(traces=[], layout={})
+        self._df: Optional[pd.DataFrame] = None
+        self._spec: Optional[VizSpec] = None
 
     # Builder-ish lifecycle
     def start(self) -> "PlotlyFigureBuilder":
-        self._s = _State(traces=[], layout={})
+        self._df = self._spec = None
         return self
 
     def bind_data(self, df: pd.DataFrame) -> "PlotlyFigureBuilder":
-        self._s.df = df
+        self._df = df
         return self
 
     def apply_spec(self, spec: VizSpec) -> "PlotlyFigureBuilder":
-        self._s.spec = spec
-        self._s.traces = _build_traces(self._s.df, spec)
-        self._s.layout = _hydrate_layout(spec)
+        self._spec = spec
         return self
 
     def build(self) -> go.Figure:
-        fig = go.Figure(data=self._s.traces or [])
-        fig.update_layout(**(self._s.layout or {}))
-        return fig
+        return _compile_impl(self._df, self._spec)
 
 
 # ---------- Registry & dispatch ----------
@@ -55,270 +55,400 @@ def register_mark(t: ChartType):
         return fn
     return deco
 
-def _build_traces(df: pd.DataFrame, spec: VizSpec) -> List[go.BaseTraceType]:
+def _build_traces_as_dicts(df: pd.DataFrame, spec: VizSpec) -> List[Dict[str, Any]]:
     t = spec.chart.type
-    if t not in _MARK_REGISTRY:
+    factory = _MARK_REGISTRY.get(t)
+    if factory is None:
         raise ValueError(f"No mark factory registered for chart type: {t}")
-    return _MARK_REGISTRY[t](df, spec)
+    return factory(df, spec)
 
 
 # ---------- Shared helpers ----------
 
+# Trace types whose schema has marker.size / a top-level line.
+_MARKER_SIZE_TYPES = {"scatter", "box"}
+_LINE_TYPES = {"scatter", "box"}
+
+def _trace(type_: str, **props: Any) -> Dict[str, Any]:
+    # Drop unset props so the dict matches what plotly would serialize.
+    tr = {"type": type_}
+    for k, v in props.items():
+        if v is not None:
+            tr[k] = v
+    return tr
+
+def _col(df: pd.DataFrame, c: Optional[str]) -> Optional[np.ndarray]:
+    return df[c].to_numpy() if c else None
+
+def _column_reader(df: pd.DataFrame) -> Callable[[Optional[str]], Optional[np.ndarray]]:
+    # Per-call memo: a column used by several traces (shared x in multi-y) is
+    # converted once and every trace gets the same ndarray.
+    cache: Dict[str, np.ndarray] = {}
+    def col(c: Optional[str]) -> Optional[np.ndarray]:
+        if not c:
+            return None
+        arr = cache.get(c)
+        if arr is None:
+            arr = cache[c] = df[c].to_numpy()
+        return arr
+    return col
+
+def _take(arr: Optional[np.ndarray], idx: np.ndarray) -> Optional[np.ndarray]:
+    return arr[idx] if arr is not None else None
+
+def _group_indices(df: pd.DataFrame, by: str) -> Dict[Any, np.ndarray]:
+    # Row positions per category (sorted keys, NaN last), without building
+    # a sub-DataFrame per group; callers fancy-index only the columns they use.
+    return _split_positions(df[by])
+
+def _split_positions(values: Any, *, keep_na: bool = True, sort: bool = True) -> Dict[Any, np.ndarray]:
+    # Stable argsort of the factorized codes + run boundaries: no groupby hash table.
+    # sort=False keeps keys in order of first appearance.
+    codes, uniques = pd.factorize(values, sort=sort, use_na_sentinel=not keep_na)
+    order = np.argsort(codes, kind="stable")
+    if not keep_na:
+        order = order[codes[order] >= 0]
+    bounds = np.flatnonzero(np.diff(codes[order])) + 1
+    return dict(zip(uniques, np.split(order, bounds)))
+
 def _resolve_trace_name(raw: str, labels_map: Optional[Dict[str, str]]) -> str:
     if labels_map and raw in labels_map:
         return labels_map[raw]
     return raw
 
-def _apply_common_encodings(trace: go.BaseTraceType, spec: VizSpec) -> None:
-    enc = (spec.data.encodings or None)
+# Encoding/color/axis helpers take pre-resolved spec fields: factories read them off
+# the pydantic models once per call instead of once per trace.
+
+def _encoding_props(type_: str, enc: Optional[EncodingsSpec]) -> Dict[str, Any]:
+    # Partially evaluate the encodings for one trace type: every branch on the
+    # EncodingsSpec runs once per factory call, not once per trace.
+    props: Dict[str, Any] = {}
     if not enc:
-        return
+        return props
     # opacity
     if enc.opacity is not None:
-        trace.opacity = enc.opacity
-    # marker size
-    try:
-        if enc.marker_size is not None and hasattr(trace, "marker"):
-            # merge-friendly update
-            marker = getattr(trace, "marker", {}) or {}
-            marker["size"] = enc.marker_size
-            trace.marker = marker
-    except Exception:
-        pass
+        props["opacity"] = enc.opacity
+    # marker size (only trace types whose marker has a size)
+    if enc.marker_size is not None and type_ in _MARKER_SIZE_TYPES:
+        props["marker"] = {"size": enc.marker_size}
     # line shape (Scatter)
-    if enc.line_shape is not None and isinstance(trace, go.Scatter):
-        trace.line = {**(trace.line or {}), "shape": enc.line_shape.value}
-
-def _apply_color(trace: go.BaseTraceType, name: str, spec: VizSpec) -> None:
-    cmap = (spec.data.colors.color_map if spec.data.colors else None)
-    if not cmap:
-        return
-    color = cmap.get(name)
-    if not color:
-        return
-    # Try to set both marker and line color when available
-    if hasattr(trace, "marker") and trace.marker is not None:
-        m = dict(trace.marker)
-        m["color"] = color
-        trace.marker = m
-    if hasattr(trace, "line") and trace.line is not None:
-        l = dict(trace.line)
-        l["color"] = color
-        trace.line = l
-
-def _maybe_y2(name: str, spec: VizSpec) -> Optional[str]:
-    axis = spec.data.axis
-    if axis and axis.y2_for:
-        if name in axis.y2_for:
-            return "y2"
+    if enc.line_shape is not None and type_ == "scatter":
+        props["line"] = {"shape": enc.line_shape.value}
+    return props
+
+def _make_trace(type_: str, enc_props: Dict[str, Any], color: Optional[str] = None, **props: Any) -> Dict[str, Any]:
+    # Data props, encodings and mapped color in one dict build, no post-hoc merges.
+    tr = _trace(type_, **props)
+    for k, v in enc_props.items():
+        # nested dicts are copied per trace
+        tr[k] = dict(v) if isinstance(v, dict) else v
+    if color:
+        # Set both marker and line color when the trace type has them
+        tr.setdefault("marker", {})["color"] = color
+        if type_ in _LINE_TYPES:
+            tr.setdefault("line", {})["color"] = color
+    return tr
+
+def _maybe_y2(name: str, y2_for: Optional[List[str]]) -> Optional[str]:
+    if y2_for and name in y2_for:
+        return "y2"
     return None
 
 def _hydrate_layout(spec: VizSpec) -> Dict[str, Any]:
+    # Emits plotly's canonical nested form (no magic underscores) so the dict is
+    # valid both for update_layout and as raw figure JSON.
     L = {}
-    if spec.layout:
+    lay = spec.layout
+    if lay:
         # simple passthrough of known fields
-        if spec.layout.title is not None:       L["title"] = spec.layout.title
-        if spec.layout.xaxis_title is not None: L["xaxis_title"] = spec.layout.xaxis_title
-        if spec.layout.yaxis_title is not None: L["yaxis_title"] = spec.layout.yaxis_title
+        if lay.title is not None:       L["title"] = {"text": lay.title}
+        if lay.xaxis_title is not None: L["xaxis"] = {"title": {"text": lay.xaxis_title}}
+        if lay.yaxis_title is not None: L["yaxis"] = {"title": {"text": lay.yaxis_title}}
         # y2 axis setup if requested
-        y2_title = spec.layout.yaxis2_title if spec.layout.yaxis2_title is not None else None
-        if (spec.data and spec.data.axis and spec.data.axis.y2_for) or y2_title:
-            L["yaxis2"] = {"overlaying": "y", "side": "right"}
+        y2_title = lay.yaxis2_title if lay.yaxis2_title is not None else None
+        axis = spec.data.axis if spec.data else None
+        if (axis and axis.y2_for) or y2_title:
+            # horizontal bars put values on x, so their secondary axis is x2 on top
+            if spec.chart.type == ChartType.bar and spec.chart.orientation == Orientation.h:
+                key, sec = "xaxis2", {"overlaying": "x", "side": "top"}
+            else:
+                key, sec = "yaxis2", {"overlaying": "y", "side": "right"}
             if y2_title:
-                L["yaxis2"]["title"] = y2_title
-
-        if spec.layout.hovermode is not None:   L["hovermode"] = spec.layout.hovermode.value
-        if spec.layout.template is not None:    L["template"] = spec.layout.template
-        if spec.layout.colorway is not None:    L["colorway"] = spec.layout.colorway
-        if spec.layout.legend is not None:      L["legend"] = spec.layout.legend
-        if spec.layout.height is not None:      L["height"] = spec.layout.height
-        if spec.layout.width is not None:       L["width"] = spec.layout.width
+                sec["title"] = {"text": y2_title}
+            L[key] = sec
+
+        if lay.hovermode is not None:   L["hovermode"] = lay.hovermode.value
+        if lay.template is not None:    L["template"] = lay.template
+        if lay.colorway is not None:    L["colorway"] = lay.colorway
+        if lay.legend is not None:      L["legend"] = lay.legend
+        if lay.height is not None:      L["height"] = lay.height
+        if lay.width is not None:       L["width"] = lay.width
     return L
 
 
 # ---------- Mark factories ----------
 
 @register_mark(ChartType.line)
-def _line(df: pd.DataFrame, spec: VizSpec) -> List[go.BaseTraceType]:
+def _line(df: pd.DataFrame, spec: VizSpec) -> List[Dict[str, Any]]:
     return _scatter_like(df, spec, mode=spec.chart.mode.value if spec.chart.mode else "lines")
 
 @register_mark(ChartType.area)
-def _area(df: pd.DataFrame, spec: VizSpec) -> List[go.BaseTraceType]:
+def _area(df: pd.DataFrame, spec: VizSpec) -> List[Dict[str, Any]]:
     traces = _scatter_like(df, spec, mode=spec.chart.mode.value if spec.chart.mode else "lines")
     # area fill + stacking
     stackgroup = spec.data.axis.area_stackgroup if (spec.data and spec.data.axis) else None
     for tr in traces:
-        if isinstance(tr, go.Scatter):
-            tr.fill = "tozeroy"
+        if tr["type"] == "scatter":
+            tr["fill"] = "tozeroy"
             if stackgroup:
-                tr.stackgroup = stackgroup
+                tr["stackgroup"] = stackgroup
     return traces
 
 @register_mark(ChartType.scatter)
-def _scatter(df: pd.DataFrame, spec: VizSpec) -> List[go.BaseTraceType]:
+def _scatter(df: pd.DataFrame, spec: VizSpec) -> List[Dict[str, Any]]:
     return _scatter_like(df, spec, mode=spec.chart.mode.value if spec.chart.mode else "markers")
 
-def _scatter_like(df: pd.DataFrame, spec: VizSpec, *, mode: str) -> List[go.BaseTraceType]:
-    xcol = spec.data.x
-    labels_y = (spec.data.labels.y if spec.data.labels else None)
-    labels_series = (spec.data.labels.series if spec.data.labels else None)
+def _scatter_like(df: pd.DataFrame, spec: VizSpec, *, mode: str) -> List[Dict[str, Any]]:
+    d = spec.data
+    xcol, yval = d.x, d.y
+    labels = d.labels
+    labels_y = labels.y if labels else None
+    labels_series = labels.series if labels else None
+    enc_props = _encoding_props("scatter", d.encodings)
+    cmap = d.colors.color_map if d.colors else None
+    y2_for = d.axis.y2_for if d.axis else None
 
-    traces: List[go.BaseTraceType] = []
+    col = _column_reader(df)
+    traces: List[Dict[str, Any]] = []
 
-    if isinstance(spec.data.y, list):
+    if isinstance(yval, list):
         # multi-y (no series.by). One trace per y column.
-        for ycol in spec.data.y:
+        for ycol in yval:
             name = _resolve_trace_name(labels_y.get(ycol, ycol) if labels_y else ycol, labels_y)
-            tr = go.Scatter(x=df[xcol] if xcol else None, y=df[ycol], name=name, mode=mode)
-            axis = _maybe_y2(ycol, spec)
-            if axis:
-                tr.yaxis = axis
-            _apply_common_encodings(tr, spec)
-            _apply_color(tr, name, spec)
+            tr = _make_trace("scatter", enc_props, cmap.get(name) if cmap else None,
+                             x=col(xcol), y=col(ycol), name=name, mode=mode, yaxis=_maybe_y2(ycol, y2_for))
             traces.append(tr)
     else:
-        ycol = spec.data.y
-        by = spec.data.series.by if (spec.data.series and spec.data.series.by) else None
+        ycol = yval
+        by = d.series.by if (d.series and d.series.by) else None
         if by:
-            for cat, g in df.groupby(by, dropna=False):
+            x_arr, y_arr = col(xcol), col(ycol)
+            for cat, idx in _group_indices(df, by).items():
                 raw_name = str(cat)
                 name = _resolve_trace_name(raw_name, labels_series)
-                tr = go.Scatter(x=g[xcol] if xcol else None, y=g[ycol] if ycol else None, name=name, mode=mode)
-                _apply_common_encodings(tr, spec)
-                _apply_color(tr, name, spec)
+                tr = _make_trace("scatter", enc_props, cmap.get(name) if cmap else None,
+                                 x=_take(x_arr, idx), y=_take(y_arr, idx), name=name, mode=mode)
                 traces.append(tr)
         else:
-            name = spec.data.name or (labels_y.get(ycol, ycol) if (labels_y and ycol) else str(ycol))
-            tr = go.Scatter(x=df[xcol] if xcol else None, y=df[ycol] if ycol else None, name=name, mode=mode)
-            axis = _maybe_y2(name, spec)
-            if axis:
-                tr.yaxis = axis
-            _apply_common_encodings(tr, spec)
-            _apply_color(tr, name, spec)
+            name = d.name or (labels_y.get(ycol, ycol) if (labels_y and ycol) else str(ycol))
+            tr = _make_trace("scatter", enc_props, cmap.get(name) if cmap else None,
+                             x=col(xcol), y=col(ycol), name=name, mode=mode, yaxis=_maybe_y2(name, y2_for))
             traces.append(tr)
 
     return traces
 
 
 @register_mark(ChartType.bar)
-def _bar(df: pd.DataFrame, spec: VizSpec) -> List[go.BaseTraceType]:
-    xcol = spec.data.x
-    yval = spec.data.y
-    by = spec.data.series.by if (spec.data.series and spec.data.series.by) else None
+def _bar(df: pd.DataFrame, spec: VizSpec) -> List[Dict[str, Any]]:
+    d = spec.data
+    xcol, yval = d.x, d.y
+    by = d.series.by if (d.series and d.series.by) else None
     orient = (spec.chart.orientation or Orientation.v)
+    orient_value = orient.value
+
+    labels = d.labels
+    labels_y = labels.y if labels else None
+    labels_series = labels.series if labels else None
+    enc_props = _encoding_props("bar", d.encodings)
+    cmap = d.colors.color_map if d.colors else None
+    y2_for = d.axis.y2_for if d.axis else None
+
+    # Orientation is fixed per call: pick the emitter once (swap x/y if horizontal).
+    if orient == Orientation.h:
+        # values sit on x, so a secondary value axis is x2 (see _hydrate_layout)
+        def emit(X, Y, name, axis=None):
+            return _make_trace("bar", enc_props, cmap.get(name) if cmap else None,
+                               x=Y, y=X, name=name, orientation=orient_value,
+                               xaxis="x2" if axis else None)
+    else:
+        def emit(X, Y, name, axis=None):
+            return _make_trace("bar", enc_props, cmap.get(name) if cmap else None,
+                               x=X, y=Y, name=name, orientation=orient_value, yaxis=axis)
 
-    labels_y = (spec.data.labels.y if spec.data.labels else None)
-    labels_series = (spec.data.labels.series if spec.data.labels else None)
-
-    def _xy_for_bar(x, y):
-        # Swap if horizontal
-        if orient == Orientation.h:
-            return y, x
-        return x, y
-
-    traces: List[go.BaseTraceType] = []
+    col = _column_reader(df)
+    traces: List[Dict[str, Any]] = []
 
     if isinstance(yval, list):
         for ycol in yval:
             name = _resolve_trace_name(labels_y.get(ycol, ycol) if labels_y else ycol, labels_y)
-            X, Y = _xy_for_bar(df[xcol] if xcol else None, df[ycol])
-            tr = go.Bar(x=X, y=Y, name=name, orientation=orient.value)
-            axis = _maybe_y2(ycol, spec)
-            if axis:
-                tr.yaxis = axis if orient == Orientation.v else None
-                tr.xaxis = axis if orient == Orientation.h else None
-            _apply_common_encodings(tr, spec)
-            _apply_color(tr, name, spec)
-            traces.append(tr)
+            traces.append(emit(col(xcol), col(ycol), name, _maybe_y2(ycol, y2_for)))
     else:
         if by:
             # one bar trace per category in 'by'
-            for cat, g in df.groupby(by, dropna=False):
+            x_arr, y_arr = col(xcol), col(yval)
+            for cat, idx in _group_indices(df, by).items():
                 raw_name = str(cat)
                 name = _resolve_trace_name(raw_name, labels_series)
-                X, Y = _xy_for_bar(g[xcol] if xcol else None, g[yval] if yval else None)
-                tr = go.Bar(x=X, y=Y, name=name, orientation=orient.value)
-                _apply_common_encodings(tr, spec)
-                _apply_color(tr, name, spec)
-                traces.append(tr)
+                traces.append(emit(_take(x_arr, idx), _take(y_arr, idx), name))
         else:
-            name = spec.data.name or (labels_y.get(yval, yval) if (labels_y and yval) else str(yval))
-            X, Y = _xy_for_bar(df[xcol] if xcol else None, df[yval] if yval else None)
-            tr = go.Bar(x=X, y=Y, name=name, orientation=orient.value)
-            axis = _maybe_y2(name, spec)
-            if axis:
-                tr.yaxis = axis if orient == Orientation.v else None
-                tr.xaxis = axis if orient == Orientation.h else None
-            _apply_common_encodings(tr, spec)
-            _apply_color(tr, name, spec)
-            traces.append(tr)
+            name = d.name or (labels_y.get(yval, yval) if (labels_y and yval) else str(yval))
+            traces.append(emit(col(xcol), col(yval), name, _maybe_y2(name, y2_for)))
 
     return traces
 
 
+_MAX_BINS = 50
+
+def _auto_nbins(v: np.ndarray) -> int:
+    # numpy's "auto" rule (finer of Sturges / Freedman-Diaconis) as a bin *count*,
+    # capped: on skewed data FD alone can ask for hundreds of millions of bins.
+    n = v.size
+    if n < 2:
+        return 1
+    span = v.max() - v.min()
+    if span == 0:
+        return 1
+    nbins = np.log2(n) + 1.0
+    q75, q25 = np.percentile(v, [75, 25])
+    if q75 > q25:
+        nbins = max(nbins, span / (2.0 * (q75 - q25) * n ** (-1.0 / 3.0)))
+    return int(min(np.ceil(nbins), _MAX_BINS))
+
+def _prebin(v: np.ndarray, histnorm: Optional[str]) -> Dict[str, np.ndarray]:
+    # Bin server-side so the payload carries O(#bins) values instead of every sample.
+    v = v[np.isfinite(v)]
+    counts, edges = np.histogram(v, bins=_auto_nbins(v))
+    widths = np.diff(edges)
+    heights = counts.astype(np.float64)
+    total = counts.sum()
+    if histnorm == HistNorm.percent.value and total:
+        heights *= 100.0 / total
+    elif histnorm == HistNorm.probability.value and total:
+        heights /= total
+    elif histnorm == HistNorm.density.value:
+        # plotly's "density" is count / bin width (not normalized to unit area)
+        heights /= widths
+    return {"centers": edges[:-1] + widths / 2, "heights": heights, "widths": widths}
+
 @register_mark(ChartType.histogram)
-def _histogram(df: pd.DataFrame, spec: VizSpec) -> List[go.BaseTraceType]:
+def _histogram(df: pd.DataFrame, spec: VizSpec) -> List[Dict[str, Any]]:
     # Spec guarantees at least one of x or y is present.
     xcol, ycol = spec.data.x, spec.data.y if isinstance(spec.data.y, str) else None
-    traces: List[go.BaseTraceType] = []
-    if xcol and not ycol:
-        tr = go.Histogram(x=df[xcol], histnorm=spec.chart.histnorm.value if spec.chart.histnorm else None)
-    elif ycol and not xcol:
-        tr = go.Histogram(y=df[ycol], histnorm=spec.chart.histnorm.value if spec.chart.histnorm else None)
+    histnorm = spec.chart.histnorm.value if spec.chart.histnorm else None
+    # If both given, default to x (common convention); could be extended to 2D hist.
+    horizontal = bool(ycol and not xcol)
+    v = _col(df, ycol if horizontal else xcol)
+    if v.dtype.kind not in "iuf":
+        # categorical/date samples: let plotly.js bin them
+        enc_props = _encoding_props("histogram", spec.data.encodings)
+        axis = "y" if horizontal else "x"
+        return [_make_trace("histogram", enc_props, histnorm=histnorm, **{axis: v})]
+    b = _prebin(v.astype(np.float64, copy=False), histnorm)
+    enc_props = _encoding_props("bar", spec.data.encodings)
+    if horizontal:
+        tr = _make_trace("bar", enc_props, x=b["heights"], y=b["centers"], width=b["widths"], orientation="h")
     else:
-        # If both given, default to x (common convention); could be extended to 2D hist.
-        tr = go.Histogram(x=df[xcol], histnorm=spec.chart.histnorm.value if spec.chart.histnorm else None)
-    _apply_common_encodings(tr, spec)
-    traces.append(tr)
-    return traces
+        tr = _make_trace("bar", enc_props, x=b["centers"], y=b["heights"], width=b["widths"])
+    return [tr]
+
 
+def _box_stats(y: np.ndarray) -> Optional[Dict[str, Any]]:
+    # Tukey box as plotly.js draws it: quartiles interpolated at index p*n - 0.5
+    # (numpy's "hazen"), whiskers at the most extreme points within 1.5 IQR but
+    # never inside the box, everything beyond them is an outlier.
+    y = y[~np.isnan(y)]
+    if not y.size:
+        return None
+    q1, med, q3 = np.percentile(y, [25, 50, 75], method="hazen")
+    lo, hi = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+    inner = y[(y >= lo) & (y <= hi)]
+    return {"q1": q1, "median": med, "q3": q3,
+            "lowerfence": min(q1, inner.min()), "upperfence": max(q3, inner.max()),
+            "outliers": y[(y < lo) | (y > hi)]}
+
+def _box_trace(x: Optional[np.ndarray], y: Optional[np.ndarray], name: str, enc_props: Dict[str, Any]) -> Dict[str, Any]:
+    # Ship precomputed quartiles/fences + outlier points instead of every sample,
+    # so plotly.js doesn't sort N values per box. Non-numeric y keeps the raw path.
+    if y is None or y.dtype.kind not in "iuf":
+        return _make_trace("box", enc_props, x=x, y=y, name=name, boxpoints="outliers")
+    y = y.astype(np.float64, copy=False)
+    if x is None:
+        groups = {None: y}
+    else:
+        # boxes in order of first appearance, as plotly.js lays out raw samples
+        groups = {pos: y[idx] for pos, idx in _split_positions(x, keep_na=False, sort=False).items()}
+    positions, stats = [], []
+    for pos, yv in groups.items():
+        st = _box_stats(yv)
+        if st is not None:
+            positions.append(pos)
+            stats.append(st)
+    return _make_trace(
+        "box", enc_props,
+        x=positions if x is not None else None,
+        q1=[st["q1"] for st in stats], median=[st["median"] for st in stats], q3=[st["q3"] for st in stats],
+        lowerfence=[st["lowerfence"] for st in stats], upperfence=[st["upperfence"] for st in stats],
+        y=[st["outliers"] for st in stats],  # one outlier array per box position
+        name=name, boxpoints="outliers",
+    )
 
 @register_mark(ChartType.box)
-def _box(df: pd.DataFrame, spec: VizSpec) -> List[go.BaseTraceType]:
-    xcol = spec.data.x
-    yval = spec.data.y
-    by = spec.data.series.by if (spec.data.series and spec.data.series.by) else None
-    traces: List[go.BaseTraceType] = []
+def _box(df: pd.DataFrame, spec: VizSpec) -> List[Dict[str, Any]]:
+    d = spec.data
+    xcol, yval = d.x, d.y
+    by = d.series.by if (d.series and d.series.by) else None
+    enc_props = _encoding_props("box", d.encodings)
+    col = _column_reader(df)
+    traces: List[Dict[str, Any]] = []
 
     if isinstance(yval, list):
         for ycol in yval:
-            tr = go.Box(x=df[xcol] if xcol else None, y=df[ycol], name=str(ycol), boxpoints="outliers")
-            _apply_common_encodings(tr, spec)
-            traces.append(tr)
+            traces.append(_box_trace(col(xcol), col(ycol), str(ycol), enc_props))
     else:
         if by:
-            for cat, g in df.groupby(by, dropna=False):
-                tr = go.Box(x=g[xcol] if xcol else None, y=g[yval] if yval else None, name=str(cat), boxpoints="outliers")
-                _apply_common_encodings(tr, spec)
-                traces.append(tr)
+            x_arr, y_arr = col(xcol), col(yval)
+            for cat, idx in _group_indices(df, by).items():
+                traces.append(_box_trace(_take(x_arr, idx), _take(y_arr, idx), str(cat), enc_props))
         else:
-            tr = go.Box(x=df[xcol] if xcol else None, y=df[yval] if yval else None, name=str(yval), boxpoints="outliers")
-            _apply_common_encodings(tr, spec)
-            traces.append(tr)
+            traces.append(_box_trace(col(xcol), col(yval), str(yval), enc_props))
     return traces
 
 
 @register_mark(ChartType.heatmap)
-def _heatmap(df: pd.DataFrame, spec: VizSpec) -> List[go.BaseTraceType]:
+def _heatmap(df: pd.DataFrame, spec: VizSpec) -> List[Dict[str, Any]]:
     # Expect long-form with unique (x,y); pivot wide without aggregation.
     xcol, ycol, zcol = spec.data.x, spec.data.y, spec.data.z
     if isinstance(ycol, list):
         raise ValueError("heatmap does not support list(y); provide scalar y and z.")
-    piv = df.pivot(index=ycol, columns=xcol, values=zcol).sort_index().sort_index(axis=1)
-    tr = go.Heatmap(z=piv.values, x=list(piv.columns), y=list(piv.index))
-    _apply_common_encodings(tr, spec)
+    enc_props = _encoding_props("heatmap", spec.data.encodings)
+    # Scatter z into a (y, x) grid by label codes; same result as
+    # pivot(...).sort_index().sort_index(axis=1) without the MultiIndex/reshape.
+    yi, yu = pd.factorize(df[ycol], sort=True, use_na_sentinel=False)
+    xi, xu = pd.factorize(df[xcol], sort=True, use_na_sentinel=False)
+    if len(df) and np.bincount(yi * len(xu) + xi).max() > 1:
+        raise ValueError("heatmap requires unique (x, y) pairs; pre-aggregate upstream.")
+    # Nullable/int/object z goes to float64 with missing values as NaN.
+    zs = df[zcol]
+    zdtype = zs.dtype if isinstance(zs.dtype, np.dtype) and zs.dtype.kind == "f" else np.float64
+    try:
+        zv = zs.to_numpy(dtype=zdtype, na_value=np.nan)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"heatmap z column {zcol!r} must be numeric.") from e
+    z = np.full((len(yu), len(xu)), np.nan, dtype=zv.dtype)
+    z[yi, xi] = zv
+    tr = _make_trace("heatmap", enc_props, z=z, x=list(xu), y=list(yu))
     return [tr]
 
 
 @register_mark(ChartType.pie)
-def _pie(df: pd.DataFrame, spec: VizSpec) -> List[go.BaseTraceType]:
+def _pie(df: pd.DataFrame, spec: VizSpec) -> List[Dict[str, Any]]:
     # Simple mapping: prefer (names = series.by) if present; else names = x; values = y
     by = spec.data.series.by if (spec.data.series and spec.data.series.by) else None
     if by and isinstance(spec.data.y, str):
-        names = df[by]
-        values = df[spec.data.y]
+        names = _col(df, by)
+        values = _col(df, spec.data.y)
     else:
-        names = df[spec.data.x] if spec.data.x else None
-        values = df[spec.data.y] if isinstance(spec.data.y, str) else None
-    tr = go.Pie(labels=names, values=values, sort=False)
+        names = _col(df, spec.data.x)
+        values = _col(df, spec.data.y) if isinstance(spec.data.y, str) else None
+    tr = _trace("pie", labels=names, values=values, sort=False)
     return [tr]
@@ -2,7 +2,7 @@
 import pandas as pd
 import numpy as np
 from pydantic_viz_spec import VizSpec, ChartSpec, DataSpec, LayoutSpec, ChartType, Orientation, BarMode
-from plotly_viz_engine import compile_figure
+from plotly_viz_engine import compile_figure, compile_payload, figure_to_json_dict
 
 def test_bar_multi():
     df = pd.DataFrame({"x":[1,2,3], "A":[1,2,3], "B":[3,2,1]})
@@ -23,3 +23,92 @@ def test_line_series_split():
     )
     fig = compile_figure(df, spec)
     assert len(fig.data) == 2
+
+def test_payload_matches_figure():
+    df = pd.DataFrame({"x":[1,2,3], "A":[1.0,None,3.0], "B":[3,2,1]})
+    spec = VizSpec(
+        chart=ChartSpec(type=ChartType.line),
+        data=DataSpec(x="x", y=["A","B"], axis={"y2_for":["B"]}, encodings={"opacity":0.5}),
+        layout=LayoutSpec(title="AB", xaxis_title="x", yaxis2_title="B", template="plotly_white")
+    )
+    payload = compile_payload(df, spec)
+    assert payload["figure"] == figure_to_json_dict(compile_figure(df, spec))
+
+def test_heatmap_grid():
+    df = pd.DataFrame({"x":["b","a","b","c"], "y":[2,1,1,2], "z":[1,2,3,4]})
+    spec = VizSpec(chart=ChartSpec(type=ChartType.heatmap), data=DataSpec(x="x", y="y", z="z"))
+    fig = compile_figure(df, spec)
+    piv = df.pivot(index="y", columns="x", values="z").sort_index().sort_index(axis=1)
+    assert list(fig.data[0].x) == list(piv.columns)
+    assert list(fig.data[0].y) == list(piv.index)
+    np.testing.assert_array_equal(np.asarray(fig.data[0].z, dtype=float), piv.to_numpy())
+
+def test_heatmap_nullable_z():
+    df = pd.DataFrame({"x":["a","b","a"], "y":["p","p","q"], "z":pd.array([1, None, 2], dtype="Int64")})
+    spec = VizSpec(chart=ChartSpec(type=ChartType.heatmap), data=DataSpec(x="x", y="y", z="z"))
+    assert compile_payload(df, spec)["figure"]["data"][0]["z"] == [[1.0, None], [2.0, None]]
+    assert compile_figure(df, spec).data[0].z[1][0] == 2.0
+
+def test_multi_y_shares_x_array():
+    from plotly_viz_engine.plotly_builder import _build_traces_as_dicts
+    df = pd.DataFrame({"x":[1,2,3], "A":[1,2,3], "B":[3,2,1], "C":[0,0,1]})
+    spec = VizSpec(chart=ChartSpec(type=ChartType.line), data=DataSpec(x="x", y=["A","B","C"]))
+    traces = _build_traces_as_dicts(df, spec)
+    assert all(t["x"] is traces[0]["x"] for t in traces)
+
+def test_box_precomputed_stats():
+    df = pd.DataFrame({"g":["a"]*6 + ["b"]*3, "v":[1,2,3,4,5,100, 2,2,3]})
+    spec = VizSpec(chart=ChartSpec(type=ChartType.box), data=DataSpec(x="g", y="v"))
+    tr = compile_payload(df, spec)["figure"]["data"][0]
+    assert tr["x"] == ["a", "b"]
+    assert tr["median"] == [3.5, 2.0]
+    assert tr["q1"] == [2.0, 2.0]
+    assert tr["q3"] == [5.0, 2.75]
+    assert tr["upperfence"] == [5.0, 3.0]
+    assert tr["y"] == [[100.0], []]
+
+def test_box_whiskers_clamp_and_keep_appearance_order():
+    df = pd.DataFrame({"g":["b"]*5 + ["a"]*2, "v":[0,100,100,100,100, 1,2]})
+    spec = VizSpec(chart=ChartSpec(type=ChartType.box), data=DataSpec(x="g", y="v"))
+    tr = compile_payload(df, spec)["figure"]["data"][0]
+    assert tr["x"] == ["b", "a"]
+    assert tr["q1"][0] == 75.0 and tr["lowerfence"][0] == 75.0  # never inside the box
+    assert tr["y"][0] == [0.0]
+
+def test_histogram_prebin_caps_bins_on_outliers():
+    v = np.concatenate([np.random.default_rng(0).uniform(0, 1, 100_000), [1e7, np.inf, np.nan]])
+    spec = VizSpec(chart=ChartSpec(type=ChartType.histogram), data=DataSpec(x="v"))
+    tr = compile_payload(pd.DataFrame({"v": v}), spec)["figure"]["data"][0]
+    assert tr["type"] == "bar"
+    assert 1 <= len(tr["x"]) <= 50
+    assert sum(tr["y"]) == 100_001  # inf/nan dropped, the 1e7 outlier kept
+
+def test_datetime_nat_serializes_as_null():
+    df = pd.DataFrame({"d": pd.to_datetime(["2024-01-01", None, "2024-01-03"]), "v": [1, 2, 3]})
+    spec = VizSpec(chart=ChartSpec(type=ChartType.line), data=DataSpec(x="d", y="v"))
+    tr = compile_payload(df, spec)["figure"]["data"][0]
+    assert tr["x"] == ["2024-01-01T00:00:00", None, "2024-01-03T00:00:00"]
+    assert figure_to_json_dict(compile_figure(df, spec))["data"][0]["x"][1] is None
+
+def test_nullable_and_decimal_columns_serialize():
+    from decimal import Decimal
+    import plotly.graph_objects as go
+
+    assert figure_to_json_dict(go.Figure(go.Bar(y=pd.Series([Decimal("1.5")]))))["data"][0]["y"] == [1.5]
+    df = pd.DataFrame({"x":[1,2,3], "y":pd.array([1,None,3], dtype="Int64")})
+    spec = VizSpec(chart=ChartSpec(type=ChartType.line), data=DataSpec(x="x", y="y"))
+    assert compile_payload(df, spec)["figure"]["data"][0]["y"] == [1, None, 3]
+    assert figure_to_json_dict(compile_figure(df, spec))["data"][0]["y"] == [1, None, 3]
+
+def test_horizontal_bar_secondary_axis_is_x2():
+    df = pd.DataFrame({"c":["a","b"], "A":[1,2], "B":[30,40]})
+    spec = VizSpec(
+        chart=ChartSpec(type=ChartType.bar, orientation=Orientation.h),
+        data=DataSpec(x="c", y=["A","B"], axis={"y2_for":["B"]}),
+        layout=LayoutSpec(title="h"),
+    )
+    fig = compile_payload(df, spec)["figure"]
+    assert [t.get("xaxis") for t in fig["data"]] == [None, "x2"]
+    assert fig["layout"]["xaxis2"]["overlaying"] == "x"
+    assert "yaxis2" not in fig["layout"]
+    assert compile_figure(df, spec).data[1].xaxis == "x2"
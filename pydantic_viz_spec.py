@@ -171,7 +171,7 @@ class VizSpec(BaseModel):
     layout: Optional[LayoutSpec] = None
     plotly_config: Optional[PlotlyJSConfig] = Field(None, alias="plotly_config")
 
-    model_config = ConfigDict(extra="forbid", populate_by_name=True)
+    model_config = ConfigDict(extra="forbid", populate_by_name=True, revalidate_instances="never")
 
     @model_validator(mode="after")
     def _semantic_checks(self):
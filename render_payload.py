@@ -1,5 +1,6 @@
 # render_payload.py
-import sys, json
+import sys
+import orjson
 import plotly.io as pio
 import plotly.graph_objects as go
 
@@ -8,17 +9,19 @@ def load_any(path: str) -> tuple[go.Figure, dict]:
        A) your payload: { figure: {...}, plotly_config: {...} }, or
        B) a pure Plotly figure JSON (pio.write_json).
     """
-    with open(path, "r", encoding="utf-8") as f:
-        obj = json.load(f)
+    with open(path, "rb") as f:
+        raw = f.read()
+    obj = orjson.loads(raw)
 
     # A) payload shape (your engine outputs this)
     if isinstance(obj, dict) and "figure" in obj:
-        fig = pio.from_json(json.dumps(obj["figure"]), output_type="Figure", skip_invalid=False)
+        fig_json = orjson.dumps(obj["figure"], option=orjson.OPT_SERIALIZE_NUMPY).decode()
+        fig = pio.from_json(fig_json, output_type="Figure", skip_invalid=False)
         cfg = obj.get("plotly_config", {}) or {}
         return fig, cfg
 
-    # B) pure figure JSON (created by pio.write_json or fig.to_json)
-    fig = pio.read_json(path, output_type="Figure", skip_invalid=False)
+    # B) pure figure JSON (created by pio.write_json or fig.to_json); reuse the bytes already read
+    fig = pio.from_json(raw.decode("utf-8"), output_type="Figure", skip_invalid=False)
     return fig, {}
 
 def main():
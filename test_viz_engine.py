@@ -1,34 +1,31 @@
 # test_viz_engine.py
 from __future__ import annotations
-import argparse, os, json
-from datetime import datetime, timedelta
-from typing import Dict, Any, Tuple
+import argparse, functools, os
+from pathlib import Path
+from typing import Callable, Dict, Any, Tuple
 
 import numpy as np
+import orjson
 import pandas as pd
 
-from viz_engine import compile_payload, SpecValidationError, CompileError
+from viz_engine import _PAYLOAD_CACHE, compile_figure, compile_payload, parse_viz_spec, SpecValidationError, CompileError
 
 
+@functools.cache
 def _mk_sales_timeseries() -> pd.DataFrame:
     """Daily revenue for two regions."""
     np.random.seed(7)
-    start = datetime(2024, 1, 1)
     days = 30
-    rows = []
     regions = ["na", "eu"]
-    for d in range(days):
-        date = start + timedelta(days=d)
-        for r in regions:
-            base = 1000 if r == "na" else 800
-            rows.append({
-                "date": date,
-                "region": r,
-                "revenue": base + np.random.randint(-100, 120),
-            })
-    return pd.DataFrame(rows)
+    base = np.array([1000 if r == "na" else 800 for r in regions])
+    # Same draws, same (date, region) row order as one randint per row
+    noise = np.random.randint(-100, 120, size=(days, len(regions)))
+    revenue = pd.DataFrame(base + noise, index=pd.date_range("2024-01-01", periods=days, freq="D"), columns=regions)
+    revenue.index.name, revenue.columns.name = "date", "region"
+    return revenue.stack().rename("revenue").reset_index()
 
 
+@functools.cache
 def _mk_monthly_units_aov() -> pd.DataFrame:
     """Monthly units + AOV; good for dual-axis demo."""
     months = pd.date_range("2024-01-01", periods=6, freq="MS").strftime("%Y-%m").tolist()
@@ -37,6 +34,7 @@ def _mk_monthly_units_aov() -> pd.DataFrame:
     return pd.DataFrame({"month": months, "units": units, "aov": aov})
 
 
+@functools.cache
 def _mk_category_revenue() -> pd.DataFrame:
     """Category revenue split by region; already aggregated."""
     return pd.DataFrame({
@@ -46,6 +44,7 @@ def _mk_category_revenue() -> pd.DataFrame:
     })
 
 
+@functools.cache
 def _mk_heatmap_long() -> pd.DataFrame:
     """Long-form product x month with value; no duplicate (x,y) pairs."""
     products = ["p1","p2","p3"]
@@ -145,19 +144,19 @@ def spec_heatmap() -> Dict[str, Any]:
     }
 
 
-CASES: Dict[str, Tuple[pd.DataFrame, Dict[str, Any]]] = {
-    "lines": (_mk_sales_timeseries(), spec_lines_by_region()),
-    "dual_axis": (_mk_monthly_units_aov(), spec_dual_axis_lines()),
-    "bar": (_mk_category_revenue(), spec_bar_by_region()),
-    "heatmap": (_mk_heatmap_long(), spec_heatmap()),
+# Materialized on demand so a single --case only builds its own frame/spec.
+CASES: Dict[str, Callable[[], Tuple[pd.DataFrame, Dict[str, Any]]]] = {
+    "lines": lambda: (_mk_sales_timeseries(), spec_lines_by_region()),
+    "dual_axis": lambda: (_mk_monthly_units_aov(), spec_dual_axis_lines()),
+    "bar": lambda: (_mk_category_revenue(), spec_bar_by_region()),
+    "heatmap": lambda: (_mk_heatmap_long(), spec_heatmap()),
 }
 
 
 def _write_payload(outdir: str, name: str, payload: Dict[str, Any]) -> str:
     os.makedirs(outdir, exist_ok=True)
     path = os.path.join(outdir, f"{name}.plotly.json")
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+    Path(path).write_bytes(orjson.dumps(payload))  # one C-level write, no text layer
     return path
 
 
@@ -174,7 +173,7 @@ def _summarize(payload: Dict[str, Any]) -> str:
 def run_case(name: str, outdir: str) -> None:
     if name not in CASES:
         raise SystemExit(f"unknown --case {name}; choose one of: {', '.join(CASES.keys())} or 'all'")
-    df, spec = CASES[name]
+    df, spec = CASES[name]()
     try:
         payload = compile_payload(df, spec)
         fpath = _write_payload(outdir, name, payload)
@@ -183,6 +182,125 @@ def run_case(name: str, outdir: str) -> None:
         print(f"[ERR] {name}: {e}")
 
 
+# ---------- pytest checks (python -m pytest test_viz_engine.py) ----------
+
+def test_nullable_and_decimal_columns_serialize():
+    from decimal import Decimal
+
+    line = {"chart": {"type": "line"}, "data": {"x": "x", "y": "y"}}
+    df = pd.DataFrame({"x": [1, 2, 3], "y": pd.array([1, None, 3], dtype="Int64")})
+    assert compile_payload(df, line)["figure"]["data"][0]["y"] == [1, None, 3]
+    df = pd.DataFrame({"x": pd.array(["a", None, "c"], dtype="string"),
+                       "y": pd.array([1.5, None, 2.0], dtype="Float64")})
+    (trace,) = compile_payload(df, line)["figure"]["data"]
+    assert trace["x"] == ["a", None, "c"] and trace["y"] == [1.5, None, 2.0]
+
+    bar = {"chart": {"type": "bar"}, "data": {"x": "x", "y": "y"}}
+    df = pd.DataFrame({"x": ["a", "b"], "y": [Decimal("1.5"), Decimal("2.0")]})
+    assert compile_payload(df, bar)["figure"]["data"][0]["y"] == [1.5, 2.0]
+
+
+def test_heatmap_keeps_missing_labels():
+    df = pd.DataFrame({"x": ["a", "b", "a", None], "y": ["q", None, "p", "p"], "z": [1, 2, 3, 4]})
+    spec = {"chart": {"type": "heatmap"}, "data": {"x": "x", "y": "y", "z": "z"}}
+    tr = compile_payload(df, spec)["figure"]["data"][0]
+    assert tr["x"] == ["a", "b", "nan"]
+    assert tr["y"] == ["p", "q", "nan"]
+    assert tr["z"] == [[3.0, None, 4.0], [1.0, None, None], [None, 2.0, None]]
+
+
+def test_heatmap_nullable_and_non_numeric_z():
+    spec = {"chart": {"type": "heatmap"}, "data": {"x": "x", "y": "y", "z": "z"}}
+    df = pd.DataFrame({"x": ["a", "b", "a"], "y": ["p", "p", "q"],
+                       "z": pd.array([1.5, None, 2.0], dtype="Float64")})
+    assert compile_payload(df, spec)["figure"]["data"][0]["z"] == [[1.5, None], [2.0, None]]
+    df["z"] = pd.array([1, None, 2], dtype="Int64")
+    assert compile_payload(df, spec)["figure"]["data"][0]["z"] == [[1.0, None], [2.0, None]]
+    df["z"] = ["hot", "cold", "warm"]
+    try:
+        compile_payload(df, spec)
+    except CompileError:
+        pass
+    else:
+        raise AssertionError("non-numeric z should raise CompileError")
+
+
+def test_compile_payload_accepts_legacy_json_kwargs():
+    df, spec = CASES["bar"]()
+    assert compile_payload(df, spec, ensure_ascii=True, separators=(", ", ": ")) == compile_payload(df, spec)
+
+
+def test_parse_viz_spec_returns_independent_models():
+    spec = spec_bar_by_region()
+    first = parse_viz_spec(spec)
+    first.layout.title = "mutated"
+    assert parse_viz_spec(spec).layout.title == spec["layout"]["title"]
+    df = _mk_category_revenue()
+    compile_payload(df, spec)
+    assert compile_payload(df, spec)["figure"]["layout"]["title"]["text"] == spec["layout"]["title"]
+
+
+def test_payload_cache_hits_return_independent_copies():
+    _PAYLOAD_CACHE.clear()
+    df, spec = _mk_category_revenue(), spec_bar_by_region()
+    first = compile_payload(df, spec, cache=True)
+    assert len(_PAYLOAD_CACHE) == 1
+    first["figure"]["layout"]["title"]["text"] = "mutated"
+    second = compile_payload(df, spec, cache=True)
+    assert len(_PAYLOAD_CACHE) == 1
+    assert second == compile_payload(df, spec)
+    assert second is not first
+
+
+def test_payload_cache_key_tracks_dtypes_columns_and_template():
+    import plotly.io as pio
+
+    _PAYLOAD_CACHE.clear()
+    df, spec = _mk_category_revenue(), spec_bar_by_region()
+    compile_payload(df, spec, cache=True)
+    # Same values under a different dtype hash the same row-wise; they must still miss.
+    as_float = df.astype({"revenue": "float32"})
+    assert compile_payload(as_float, spec, cache=True) == compile_payload(as_float, spec)
+    # Swapped labels leave every row hash unchanged.
+    renamed = df.rename(columns={"category": "region", "region": "category"})
+    assert compile_payload(renamed, spec, cache=True) == compile_payload(renamed, spec)
+    assert len(_PAYLOAD_CACHE) == 3
+
+    # Without a layout the payload expands whatever default template is current.
+    untemplated = {k: v for k, v in spec.items() if k != "layout"}
+    default = compile_payload(df, untemplated, cache=True)
+    old_default = pio.templates.default
+    pio.templates.default = "simple_white"
+    try:
+        other = compile_payload(df, untemplated, cache=True)
+    finally:
+        pio.templates.default = old_default
+    assert len(_PAYLOAD_CACHE) == 5
+    assert other["figure"]["layout"]["template"] != default["figure"]["layout"]["template"]
+
+
+def test_horizontal_bar_swaps_axes():
+    df = _mk_category_revenue()
+    spec = {"chart": {"type": "bar", "orientation": "h"}, "data": {"x": "category", "y": "revenue"}}
+    (trace,) = compile_payload(df, spec)["figure"]["data"]
+    assert trace["orientation"] == "h"
+    assert trace["x"] == df["revenue"].tolist()
+    assert trace["y"] == df["category"].tolist()
+
+
+def test_horizontal_bar_secondary_axis_is_x2():
+    df = _mk_category_revenue().assign(units=[3, 1, 4, 1, 5, 9])
+    spec = {"chart": {"type": "bar", "orientation": "h"},
+            "data": {"x": "category", "y": ["revenue", "units"], "axis": {"y2_for": ["units"]}},
+            "layout": {"title": "h"}}
+    fig = compile_payload(df, spec)["figure"]
+    assert [t.get("xaxis") for t in fig["data"]] == [None, "x2"]
+    assert all("yaxis" not in t for t in fig["data"])
+    assert fig["layout"]["xaxis2"]["overlaying"] == "x"
+    assert "yaxis2" not in fig["layout"]
+    assert compile_figure(df, spec).data[1].xaxis == "x2"
+
+
 def main():
     ap = argparse.ArgumentParser(description="Smoke-test viz_engine with sample specs/data")
     ap.add_argument("--case", default="all", help=f"one of: {', '.join(CASES.keys())} or 'all'")
@@ -1,14 +1,21 @@
 from __future__ import annotations
-from typing import Any, Dict, Optional, Union, List, Tuple
-import json
-
+from typing import Any, Callable, Dict, FrozenSet, Optional, Union, List, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from decimal import Decimal
+import hashlib
+import re
+import threading
+
+import orjson
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 import plotly.io as pio
 
 from pydantic import ValidationError
-from pydantic_viz_spec import VizSpec, ChartType, Mode, Orientation
+from pydantic_viz_spec import VizSpec, ChartType, EncodingsSpec, Mode, Orientation
 
 
 __all__ = [
@@ -36,11 +43,26 @@ def parse_viz_spec(spec: Union[str, Dict[str, Any], VizSpec]) -> VizSpec:
     """
     Parse/validate a spec provided by an LLM (str JSON or dict) into VizSpec.
     """
+    # Always a fresh model, since callers may mutate it; only the compile entry
+    # points, which never hand the model out, go through the shared cache.
+    return _parse_spec(spec, shared=False)
+
+
+def _parse_spec(spec: Union[str, Dict[str, Any], VizSpec], *, shared: bool) -> VizSpec:
     if isinstance(spec, VizSpec):
         return spec
     try:
         if isinstance(spec, str):
-            return VizSpec.model_validate_json(spec)
+            return _parse_spec_json(spec) if shared else VizSpec.model_validate_json(spec)
+        if isinstance(spec, dict) and shared:
+            # Measured on VizSpec: a cold dumps + model_validate_json is ~15% slower
+            # than model_validate(dict), but a cache hit is just the ~1us dumps.
+            try:
+                key = orjson.dumps(spec)
+            except orjson.JSONEncodeError:
+                # not plain JSON (e.g. nested models); validate uncached
+                return VizSpec.model_validate(spec)
+            return _parse_spec_json(key)
         return VizSpec.model_validate(spec)
     except ValidationError as ve:
         raise SpecValidationError(ve.json()) from ve
@@ -48,84 +70,95 @@ def parse_viz_spec(spec: Union[str, Dict[str, Any], VizSpec]) -> VizSpec:
         raise SpecParseError(str(e)) from e
 
 
+@lru_cache(maxsize=256)
+def _parse_spec_json(s: Union[str, bytes]) -> VizSpec:
+    # Specs repeat across calls. The cached models are shared, so they must stay
+    # internal to compile_figure/compile_payload and never be mutated.
+    return VizSpec.model_validate_json(s)
+
+
 def compile_figure(df: pd.DataFrame, spec: Union[VizSpec, Dict[str, Any], str]) -> go.Figure:
     """
     Deterministic, transform-free (no filters/agg) hydration of a VizSpec into a Plotly Figure.
     """
-    model = parse_viz_spec(spec)
+    # Traces and layout are assembled as plain dicts; the Figure validates them once.
+    return go.Figure(_compile_fig_json(df, _parse_spec(spec, shared=True)))
+
+
+def _compile_fig_json(df: pd.DataFrame, model: VizSpec) -> Dict[str, Any]:
+    """Build {"data": [...], "layout": {...}} without instantiating any plotly objects."""
     chart = model.chart
     data = model.data
-    layout = model.layout
 
     _ensure_columns(df, [c for c in [data.x] + _listify(data.y) + [data.z, data.text] if c])
 
-    fig = go.Figure()
-
     # Trace creation
-    if chart.type in (ChartType.line, ChartType.scatter, ChartType.area):
-        _add_scatter_family(fig, df, model)
-
-    elif chart.type == ChartType.bar:
-        _add_bar(fig, df, model)
-
-    elif chart.type == ChartType.histogram:
-        _add_histogram(fig, df, model)
+    builder = _BUILDERS.get(chart.type)
+    if builder is None:
+        raise CompileError(f"Unsupported chart type: {chart.type}")
+    traces = builder(df, _CompileCtx.from_spec(model))
 
-    elif chart.type == ChartType.box:
-        _add_box(fig, df, model)
+    # Defensive limits
+    _guard_traces(traces, max_traces=64)
 
-    elif chart.type == ChartType.heatmap:
-        _add_heatmap(fig, df, model)
+    return {"data": traces, "layout": _build_layout(model)}
 
-    elif chart.type == ChartType.pie:
-        _add_pie(fig, df, model)
 
-    else:
-        raise CompileError(f"Unsupported chart type: {chart.type}")
+def _build_layout(spec: VizSpec) -> Dict[str, Any]:
+    # Plotly's canonical nested form (title.text, xaxis.title.text), unset fields omitted.
+    chart = spec.chart
+    data = spec.data
+    layout = spec.layout
+    lay: Dict[str, Any] = {}
 
     # Layout (presentation only)
     if layout:
-        fig.update_layout(
-            title=layout.title,
-            xaxis_title=layout.xaxis_title,
-            yaxis_title=layout.yaxis_title,
-            hovermode=(layout.hovermode.value if layout.hovermode else None),
-            template=layout.template,
-            colorway=layout.colorway,
-            legend=layout.legend,
-            height=layout.height,
-            width=layout.width,
-        )
+        if layout.title is not None:
+            lay["title"] = {"text": layout.title}
+        if layout.xaxis_title is not None:
+            lay["xaxis"] = {"title": {"text": layout.xaxis_title}}
+        if layout.yaxis_title is not None:
+            lay["yaxis"] = {"title": {"text": layout.yaxis_title}}
+        if layout.hovermode:
+            lay["hovermode"] = layout.hovermode.value
+        # An unset template means no template (update_layout(template=None) semantics),
+        # not plotly's default one.
+        lay["template"] = layout.template if layout.template is not None else {}
+        if layout.colorway is not None:
+            lay["colorway"] = list(layout.colorway)
+        if layout.legend is not None:
+            lay["legend"] = dict(layout.legend)
+        if layout.height is not None:
+            lay["height"] = layout.height
+        if layout.width is not None:
+            lay["width"] = layout.width
         # y2 only when referenced
         if data.axis and data.axis.y2_for:
-            fig.update_layout(yaxis2=dict(
-                title=layout.yaxis2_title,
-                overlaying="y",
-                side="right",
-            ))
+            # horizontal bars put values on x, so their secondary axis is x2 on top
+            if chart.type == ChartType.bar and chart.orientation == Orientation.h:
+                key, axis2 = "xaxis2", {"overlaying": "x", "side": "top"}
+            else:
+                key, axis2 = "yaxis2", {"overlaying": "y", "side": "right"}
+            if layout.yaxis2_title is not None:
+                axis2["title"] = {"text": layout.yaxis2_title}
+            lay[key] = axis2
 
     # Bar mode lives on layout
     if chart.type == ChartType.bar and chart.barmode:
-        fig.update_layout(barmode=chart.barmode.value)
-
-    # Defensive limits
-    _guard_traces(fig, max_traces=64)
+        lay["barmode"] = chart.barmode.value
 
-    return fig
+    return lay
 
 # --- serde helpers for figure JSON round-trip ---
-import json
-import plotly.io as pio
-import plotly.graph_objects as go
-from typing import Tuple, Dict, Any
 
 def figure_to_json_dict(fig: go.Figure) -> Dict[str, Any]:
-    """Use Plotly's encoder to get a pure-JSON dict for a figure."""
-    return json.loads(pio.to_json(fig, validate=False, pretty=False))
+    """Get a pure-JSON dict for a figure (arrays as lists, datetimes as ISO strings)."""
+    # to_dict() skips plotly's string encoder; one orjson pass makes the arrays JSON-safe
+    return orjson.loads(_to_json_bytes(fig.to_dict()))
 
 def json_dict_to_figure(fig_json: Dict[str, Any]) -> go.Figure:
     """Construct a Figure from a JSON-safe dict (the reverse of figure_to_json_dict)."""
-    return pio.from_json(json.dumps(fig_json), output_type="Figure", skip_invalid=False)
+    return go.Figure(fig_json)
 
 
 def compile_payload(
@@ -134,163 +167,344 @@ def compile_payload(
     *,
     ensure_ascii: bool = False,
     separators: Tuple[str, str] = (",", ":"),
+    preview: bool = False,
+    cache: bool = False,
 ) -> Dict[str, Any]:
-    model = parse_viz_spec(spec)
-    fig = compile_figure(df, model)
+    # ensure_ascii/separators only shaped the old json.dumps guard; they are still
+    # accepted so existing callers keep working, but have no effect.
+    model = _parse_spec(spec, shared=True)
+
+    # Optional content-addressed cache of the final JSON, keyed on (df, spec)
+    key = _payload_key(df, model) if cache else None
+    blob = None
+    if key is not None:
+        with _PAYLOAD_LOCK:
+            blob = _PAYLOAD_CACHE.get(key)
+            if blob is not None:
+                _PAYLOAD_CACHE.move_to_end(key)
+    if blob is not None:
+        payload = orjson.loads(blob)
+    else:
+        # Already pure JSON (it comes out of orjson.loads); serialize only to cache it.
+        payload = _build_payload(df, model)
+        if key is not None:
+            blob = orjson.dumps(payload)
+            with _PAYLOAD_LOCK:
+                _PAYLOAD_CACHE[key] = blob
+                if len(_PAYLOAD_CACHE) > _PAYLOAD_CACHE_SIZE:
+                    _PAYLOAD_CACHE.popitem(last=False)
+
+    # Opt-in only: renderer startup is far slower than the compile itself.
+    if preview:
+        go.Figure(payload["figure"]).show()
+    return payload
+
 
-    fig.show()
-    # Force pure-JSON (lists for arrays), not json+binary
-    fig_json_str = pio.to_json(fig, validate=False, pretty=False, engine="json", remove_uids=True)
-    fig_json: Dict[str, Any] = json.loads(fig_json_str)
+def _build_payload(df: pd.DataFrame, model: VizSpec) -> Dict[str, Any]:
+    fig_dict = _compile_fig_json(df, model)
 
-    payload = {
+    # go.Figure would expand the template name (or the default) into the full template
+    template = fig_dict["layout"].get("template", pio.templates.default)
+    if isinstance(template, str):
+        fig_dict["layout"]["template"] = orjson.loads(_template_json(template))
+    # Force pure-JSON (lists for arrays); orjson handles ndarrays, datetimes and NaN itself
+    fig_json: Dict[str, Any] = orjson.loads(_to_json_bytes(fig_dict))
+
+    return {
         "figure": fig_json,
         "plotly_config": (model.plotly_config.model_dump(by_alias=True) if model.plotly_config else {}),
         "viz_spec_version": model.version,
     }
 
-    json.dumps(payload, ensure_ascii=ensure_ascii, separators=separators)  # final guard
-    return payload
+
+# Serialized payloads, so every hit hands out a fresh copy.
+_PAYLOAD_CACHE: "OrderedDict[str, bytes]" = OrderedDict()
+_PAYLOAD_CACHE_SIZE = 32
+# get+move_to_end and set+popitem must not interleave across threads.
+_PAYLOAD_LOCK = threading.Lock()
+
+def _payload_key(df: pd.DataFrame, model: VizSpec) -> Optional[str]:
+    try:
+        rows = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    except TypeError:
+        return None  # unhashable cells (lists, dicts): don't cache
+    h = hashlib.blake2b(rows.tobytes(), digest_size=16)
+    # Row hashes ignore labels and dtypes; those are part of the content too.
+    h.update(orjson.dumps([[str(c) for c in df.columns], [str(t) for t in df.dtypes]]))
+    h.update(model.model_dump_json().encode())
+    # A spec without a template picks up the process-wide default at build time.
+    h.update(str(pio.templates.default).encode())
+    return h.hexdigest()
+
+
+@lru_cache(maxsize=32)
+def _template_json(name: str) -> bytes:
+    # Cached as bytes so every payload gets its own (cheaply parsed) copy.
+    try:
+        template = pio.templates[name]
+    except KeyError as e:
+        raise CompileError(f"unknown template: {name!r}") from e
+    return _to_json_bytes(template.to_plotly_json())
+
+
+_ORJSON_OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+def _orjson_default(obj: Any) -> Any:
+    # orjson falls through here for pandas containers, object-dtype arrays and scalars
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return _values(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if obj is pd.NaT or obj is pd.NA:
+        return None
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def _to_json_bytes(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=_orjson_default, option=_ORJSON_OPTS)
 
 
 # ---------- Helpers: traces ----------
 
-def _add_scatter_family(fig: go.Figure, df: pd.DataFrame, spec: VizSpec) -> None:
+@dataclass(frozen=True, slots=True)
+class _CompileCtx:
+    """Spec lookups resolved once per compile instead of once per trace."""
+    spec: VizSpec
+    y2_set: FrozenSet[str]
+    colors: Dict[str, str]
+    y_labels: Dict[str, str]
+    series_labels: Dict[str, str]
+    enc: Optional[EncodingsSpec]
+
+    @classmethod
+    def from_spec(cls, spec: VizSpec) -> "_CompileCtx":
+        data = spec.data
+        labels = data.labels
+        return cls(
+            spec=spec,
+            y2_set=frozenset(data.axis.y2_for) if (data.axis and data.axis.y2_for) else frozenset(),
+            colors=(data.colors.color_map or {}) if data.colors else {},
+            y_labels=(labels.y or {}) if labels else {},
+            series_labels=(labels.series or {}) if labels else {},
+            enc=data.encodings,
+        )
+
+
+def _trace(type_: str, **props: Any) -> Dict[str, Any]:
+    # Unset (None) props are dropped, matching what plotly would serialize.
+    tr: Dict[str, Any] = {"type": type_}
+    for k, v in props.items():
+        if v is not None:
+            tr[k] = v
+    return tr
+
+
+def _values(s: pd.Series) -> np.ndarray:
+    # orjson rejects NaT inside datetime64 arrays; keep those as Timestamps/NaT
+    if s.dtype.kind == "M" and s.hasnans:
+        return s.astype(object).to_numpy()
+    return s.to_numpy()
+
+
+def _group_indices(df: pd.DataFrame, by: str) -> Dict[Any, np.ndarray]:
+    # label -> row positions from factorize + one stable argsort, no per-group
+    # sub-DataFrames. Sorted keys keep the legend order stable; missing keys are
+    # dropped and unused categories never appear, as with groupby(observed=True).
+    codes, uniques = pd.factorize(df[by], sort=True)
+    if len(uniques) < np.iinfo(np.int16).max:
+        codes = codes.astype(np.int16)  # numpy's stable sort is a radix sort at 16 bits
+    order = np.argsort(codes, kind="stable")
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    # -1 (missing) codes sort first; each group is one contiguous run after them
+    ends = (len(codes) - counts.sum()) + np.cumsum(counts)
+    return {key: order[end - n:end] for key, n, end in zip(uniques, counts, ends)}
+
+
+_DATE_LIKE = re.compile(r"^\d{4}-\d{2}")
+
+def _coerce_dates(s: pd.Series) -> pd.Series:
+    # Only object columns whose first non-null value looks like an ISO date are
+    # parsed; numeric and categorical axes are returned untouched.
+    if s.dtype != object:
+        return s
+    notna = s.notna().to_numpy()
+    if not notna.any():
+        return s
+    sample = s.iat[int(notna.argmax())]
+    if not (isinstance(sample, str) and _DATE_LIKE.match(sample)):
+        return s
+    try:
+        return pd.to_datetime(s, errors="ignore")
+    except Exception:
+        return s
+
+
+def _build_scatter(
+    x: Optional[np.ndarray],
+    y: Optional[np.ndarray],
+    *,
+    mode: str,
+    name: str,
+    text: Optional[np.ndarray] = None,
+    marker: Optional[Dict[str, Any]] = None,
+    line: Optional[Dict[str, Any]] = None,
+    opacity: Optional[float] = None,
+    yaxis: Optional[str] = None,
+    fill: Optional[str] = None,
+    stackgroup: Optional[str] = None,
+) -> Dict[str, Any]:
+    # The final trace in one build; unset (None) fields are dropped.
+    tr = {
+        "type": "scatter", "x": x, "y": y, "mode": mode, "name": name, "text": text,
+        "marker": marker, "line": line, "opacity": opacity, "yaxis": yaxis,
+        "fill": fill, "stackgroup": stackgroup,
+    }
+    return {k: v for k, v in tr.items() if v is not None}
+
+
+def _add_scatter_family(df: pd.DataFrame, ctx: _CompileCtx) -> List[Dict[str, Any]]:
+    spec = ctx.spec
     data = spec.data
     chart = spec.chart
     mode = chart.mode.value if chart.mode else (Mode.lines.value if chart.type in (ChartType.line, ChartType.area) else Mode.markers.value)
+    traces: List[Dict[str, Any]] = []
 
     # Area = Scatter + fill (+ optional stackgroup)
-    area_opts = {}
+    fill = stackgroup = None
     if chart.type == ChartType.area:
-        area_opts.update(fill="tozeroy")
+        fill = "tozeroy"
         if data.axis and data.axis.area_stackgroup:
-            area_opts.update(stackgroup=data.axis.area_stackgroup)
+            stackgroup = data.axis.area_stackgroup
+
+    # Encodings are the same for every trace; only the mapped color varies
+    enc = ctx.enc
+    opacity = enc.opacity if enc else None
+    size = enc.marker_size if enc else None
+    shape = enc.line_shape.value if (enc and enc.line_shape) else None
+
+    def emit(x: Optional[np.ndarray], y: Optional[np.ndarray], text: Optional[np.ndarray],
+             name: str, ycol: Optional[str]) -> None:
+        color = ctx.colors.get(name) if name else None
+        marker = {k: v for k, v in (("size", size), ("color", color)) if v is not None}
+        line = {k: v for k, v in (("shape", shape), ("color", color)) if v is not None}
+        traces.append(_build_scatter(
+            x, y, mode=mode, name=name, text=text,
+            marker=marker or None, line=line or None, opacity=opacity,
+            yaxis="y2" if ycol in ctx.y2_set else None,
+            fill=fill, stackgroup=stackgroup,
+        ))
 
     # Normalize x dtype if it looks like dates (no transform, just dtype casting)
     x = data.x
-    if x and not np.issubdtype(df[x].dtype, np.datetime64):
-        try:
-            df = df.copy()
-            df[x] = pd.to_datetime(df[x], errors="ignore")
-        except Exception:
-            pass
-
-    textvals = df[data.text] if data.text else None
+    # Columns are read into arrays once; traces take them whole or fancy-indexed
+    x_arr = _values(_coerce_dates(df[x])) if x else None
+    text_arr = _values(df[data.text]) if data.text else None
 
     if isinstance(data.y, list) and not (data.series and data.series.by):
+        y_arrs = {yc: _values(df[yc]) for yc in data.y}
         for yc in data.y:
-            display_name = _label_y(spec, yc)
-            tr = go.Scatter(
-                x=df[x] if x else None,
-                y=df[yc],
-                mode=mode,
-                name=display_name,
-                text=textvals,
-                **area_opts,
-            )
-            _apply_common(tr, name_key=display_name, spec=spec)
-            _route_axis(tr, ycol=yc, spec=spec)
-            fig.add_trace(tr)
+            emit(x_arr, y_arrs[yc], text_arr, _label_y(ctx, yc), yc)
 
     elif data.series and data.series.by:
         group_col = data.series.by
         ycol = data.y if isinstance(data.y, str) or data.y is None else data.y[0]
-        for key, g in df.groupby(group_col):
-            display_name = _label_series(spec, key, fallback=_label_y(spec, ycol))
-            tr = go.Scatter(
-                x=g[x] if x else None,
-                y=g[ycol] if ycol else None,
-                mode=mode,
-                name=display_name,
-                text=g[data.text] if data.text else None,
-                **area_opts,
+        y_arr = _values(df[ycol]) if ycol else None
+        for key, idx in _group_indices(df, group_col).items():
+            emit(
+                x_arr[idx] if x_arr is not None else None,
+                y_arr[idx] if y_arr is not None else None,
+                text_arr[idx] if text_arr is not None else None,
+                _label_series(ctx, key, fallback=_label_y(ctx, ycol)),
+                ycol,
             )
-            _apply_common(tr, name_key=display_name, spec=spec)
-            _route_axis(tr, ycol=ycol, spec=spec)
-            fig.add_trace(tr)
 
     else:
         ycol = data.y if isinstance(data.y, str) or data.y is None else data.y[0]
-        display_name = _label_y(spec, ycol)
-        tr = go.Scatter(
-            x=df[x] if x else None,
-            y=df[ycol] if ycol else None,
-            mode=mode,
-            name=display_name,
-            text=textvals,
-            **area_opts,
-        )
-        _apply_common(tr, name_key=display_name, spec=spec)
-        _route_axis(tr, ycol=ycol, spec=spec)
-        fig.add_trace(tr)
+        emit(x_arr, _values(df[ycol]) if ycol else None, text_arr, _label_y(ctx, ycol), ycol)
 
+    return traces
 
-def _add_bar(fig: go.Figure, df: pd.DataFrame, spec: VizSpec) -> None:
+
+def _add_bar(df: pd.DataFrame, ctx: _CompileCtx) -> List[Dict[str, Any]]:
+    spec = ctx.spec
     data = spec.data
     orient = (spec.chart.orientation.value if spec.chart.orientation else Orientation.v.value)
-    X, Y = (data.x, data.y) if orient == "v" else (data.y, data.x)
-    textvals = df[data.text] if data.text else None
+    # data.x always holds the categories; orientation only decides which axis they go on
+    cat_arr = _values(df[data.x])
+    text_arr = _values(df[data.text]) if data.text else None
+    traces: List[Dict[str, Any]] = []
+
+    def bar(cats: np.ndarray, vals: np.ndarray, **props: Any) -> Dict[str, Any]:
+        if orient == "v":
+            return _trace("bar", x=cats, y=vals, **props)
+        return _trace("bar", x=vals, y=cats, orientation="h", **props)
 
     if isinstance(data.y, list) and not (data.series and data.series.by):
+        y_arrs = {yc: _values(df[yc]) for yc in data.y}
         for yc in data.y:
-            display_name = _label_y(spec, yc)
-            tr = go.Bar(**(
-                {"x": df[X], "y": df[yc]} if orient == "v" else {"x": df[yc], "y": df[X]}
-            ), name=display_name, text=textvals)
-            _apply_common(tr, name_key=display_name, spec=spec)
-            _route_axis(tr, ycol=yc, spec=spec)
-            fig.add_trace(tr)
+            display_name = _label_y(ctx, yc)
+            tr = bar(cat_arr, y_arrs[yc], name=display_name, text=text_arr)
+            _apply_common(tr, name_key=display_name, ctx=ctx)
+            _route_axis(tr, ycol=yc, ctx=ctx)
+            traces.append(tr)
 
     elif data.series and data.series.by:
         group_col = data.series.by
         ycol = data.y if isinstance(data.y, str) else data.y[0]
-        for key, g in df.groupby(group_col):
-            display_name = _label_series(spec, key, fallback=_label_y(spec, ycol))
-            tr = go.Bar(**(
-                {"x": g[X], "y": g[ycol]} if orient == "v" else {"x": g[ycol], "y": g[X]}
-            ), name=display_name, text=g[data.text] if data.text else None)
-            _apply_common(tr, name_key=display_name, spec=spec)
-            _route_axis(tr, ycol=ycol, spec=spec)
-            fig.add_trace(tr)
+        val_arr = _values(df[ycol])
+        for key, idx in _group_indices(df, group_col).items():
+            display_name = _label_series(ctx, key, fallback=_label_y(ctx, ycol))
+            tr = bar(cat_arr[idx], val_arr[idx], name=display_name,
+                     text=text_arr[idx] if text_arr is not None else None)
+            _apply_common(tr, name_key=display_name, ctx=ctx)
+            _route_axis(tr, ycol=ycol, ctx=ctx)
+            traces.append(tr)
 
     else:
         ycol = data.y if isinstance(data.y, str) else data.y[0]
-        display_name = _label_y(spec, ycol)
-        tr = go.Bar(**(
-            {"x": df[X], "y": df[ycol]} if orient == "v" else {"x": df[ycol], "y": df[X]}
-        ), name=display_name, text=textvals)
-        _apply_common(tr, name_key=display_name, spec=spec)
-        _route_axis(tr, ycol=ycol, spec=spec)
-        fig.add_trace(tr)
+        display_name = _label_y(ctx, ycol)
+        tr = bar(cat_arr, _values(df[ycol]), name=display_name, text=text_arr)
+        _apply_common(tr, name_key=display_name, ctx=ctx)
+        _route_axis(tr, ycol=ycol, ctx=ctx)
+        traces.append(tr)
 
+    return traces
 
-def _add_histogram(fig: go.Figure, df: pd.DataFrame, spec: VizSpec) -> None:
+
+def _add_histogram(df: pd.DataFrame, ctx: _CompileCtx) -> List[Dict[str, Any]]:
+    spec = ctx.spec
     data = spec.data
     col = data.x or (data.y if isinstance(data.y, str) else (data.y[0] if isinstance(data.y, list) else None))
-    tr = go.Histogram(x=df[col], histnorm=(spec.chart.histnorm.value if spec.chart.histnorm else None))
-    _apply_common(tr, name_key=col or "", spec=spec)
-    fig.add_trace(tr)
+    tr = _trace("histogram", x=_values(df[col]), histnorm=(spec.chart.histnorm.value if spec.chart.histnorm else None))
+    _apply_common(tr, name_key=col or "", ctx=ctx)
+    return [tr]
 
 
-def _add_box(fig: go.Figure, df: pd.DataFrame, spec: VizSpec) -> None:
+def _add_box(df: pd.DataFrame, ctx: _CompileCtx) -> List[Dict[str, Any]]:
+    spec = ctx.spec
     data = spec.data
+    text_arr = _values(df[data.text]) if data.text else None
     if data.x and isinstance(data.y, str):
-        display_name = _label_y(spec, data.y)
-        tr = go.Box(x=df[data.x], y=df[data.y], boxpoints="outliers", name=display_name,
-                    text=df[data.text] if data.text else None)
-        _apply_common(tr, name_key=display_name, spec=spec)
-        fig.add_trace(tr)
+        display_name = _label_y(ctx, data.y)
+        tr = _trace("box", x=_values(df[data.x]), y=_values(df[data.y]), boxpoints="outliers", name=display_name,
+                    text=text_arr)
+        _apply_common(tr, name_key=display_name, ctx=ctx)
     else:
         ycol = data.y if isinstance(data.y, str) else (data.y[0] if isinstance(data.y, list) else None)
-        display_name = _label_y(spec, ycol)
-        tr = go.Box(y=df[ycol], boxpoints="outliers", name=display_name,
-                    text=df[data.text] if data.text else None)
-        _apply_common(tr, name_key=display_name or "", spec=spec)
-        fig.add_trace(tr)
+        display_name = _label_y(ctx, ycol)
+        tr = _trace("box", y=_values(df[ycol]), boxpoints="outliers", name=display_name,
+                    text=text_arr)
+        _apply_common(tr, name_key=display_name or "", ctx=ctx)
+    return [tr]
 
 
-def _add_heatmap(fig: go.Figure, df: pd.DataFrame, spec: VizSpec) -> None:
+def _add_heatmap(df: pd.DataFrame, ctx: _CompileCtx) -> List[Dict[str, Any]]:
+    spec = ctx.spec
     # Shape rules:
     # - If df is already matrix-like (z only), use values directly
     # - If x,y,z given in long form, require uniqueness on (x,y) pairs; pivot wide without aggregation
@@ -298,108 +512,111 @@ def _add_heatmap(fig: go.Figure, df: pd.DataFrame, spec: VizSpec) -> None:
     x, y, z = data.x, data.y, data.z
 
     if x and y and z:
+        # Sorted label codes; a missing x/y label is kept as its own (last) row/column,
+        # the same grid the scaffold engine builds
+        xi, x_labels = pd.factorize(df[x], sort=True, use_na_sentinel=False)
+        yi, y_labels = pd.factorize(df[y], sort=True, use_na_sentinel=False)
+        zcol = df[z]
+        # numpy floats keep their width; ints, bools, nullable and object columns go
+        # to float64 with missing values (NaN/None/pd.NA) as NaN
+        zdtype = zcol.dtype if isinstance(zcol.dtype, np.dtype) and zcol.dtype.kind == "f" else np.float64
+        try:
+            zv = zcol.to_numpy(dtype=zdtype, na_value=np.nan)
+        except (TypeError, ValueError) as e:
+            raise CompileError(f"heatmap z column {z!r} must be numeric") from e
+        nx, ny = len(x_labels), len(y_labels)
         # Enforce uniqueness; no aggregation allowed per contract
-        dupe_mask = df.duplicated(subset=[x, y], keep=False)
-        if dupe_mask.any():
+        if len(xi) and np.bincount(yi * nx + xi, minlength=nx * ny).max() > 1:
             raise CompileError("heatmap long-form requires unique (x,y) pairs; pre-aggregate upstream.")
-        mat = df.pivot(index=y, columns=x, values=z)
-        tr = go.Heatmap(z=mat.values, x=mat.columns.astype(str), y=mat.index.astype(str))
-        fig.add_trace(tr)
-    else:
-        # Fallback: treat df as a numeric matrix
-        tr = go.Heatmap(z=df.values)
-        fig.add_trace(tr)
+        mat = np.full((ny, nx), np.nan, dtype=zv.dtype)
+        mat[yi, xi] = zv
+        return [_trace("heatmap", z=mat, x=x_labels.astype(str).to_numpy(), y=y_labels.astype(str).to_numpy())]
+    # Fallback: treat df as a numeric matrix
+    return [_trace("heatmap", z=df.values)]
 
 
-def _add_pie(fig: go.Figure, df: pd.DataFrame, spec: VizSpec) -> None:
+def _add_pie(df: pd.DataFrame, ctx: _CompileCtx) -> List[Dict[str, Any]]:
+    spec = ctx.spec
     data = spec.data
     val_col = data.y if isinstance(data.y, str) else (data.y[0] if isinstance(data.y, list) else None)
     if not (data.x and val_col):
         raise CompileError("pie requires x (labels) and y (values)")
-    display_name = data.name or _label_y(spec, val_col)
-    tr = go.Pie(labels=df[data.x], values=df[val_col], text=df[data.text] if data.text else None,
-                name=display_name)
-    _apply_common(tr, name_key=display_name, spec=spec)
-    fig.add_trace(tr)
+    display_name = data.name or _label_y(ctx, val_col)
+    tr = _trace("pie", labels=_values(df[data.x]), values=_values(df[val_col]),
+                text=_values(df[data.text]) if data.text else None, name=display_name)
+    _apply_common(tr, name_key=display_name, ctx=ctx)
+    return [tr]
 
 
-# ---------- Helpers: cosmetics & guards ----------
+_BUILDERS: Dict[ChartType, Callable[[pd.DataFrame, _CompileCtx], List[Dict[str, Any]]]] = {
+    ChartType.line: _add_scatter_family,
+    ChartType.scatter: _add_scatter_family,
+    ChartType.area: _add_scatter_family,
+    ChartType.bar: _add_bar,
+    ChartType.histogram: _add_histogram,
+    ChartType.box: _add_box,
+    ChartType.heatmap: _add_heatmap,
+    ChartType.pie: _add_pie,
+}
 
-def _marker_json(trace: go.BaseTraceType) -> Dict[str, Any]:
-    m = getattr(trace, "marker", None)
-    if m is None:
-        return {}
-    try:
-        return (m.to_plotly_json() or {})  # Plotly object → dict
-    except Exception:
-        return dict(m) if isinstance(m, dict) else {}
 
-def _line_json(trace: go.BaseTraceType) -> Dict[str, Any]:
-    l = getattr(trace, "line", None)
-    if l is None:
-        return {}
-    try:
-        return (l.to_plotly_json() or {})
-    except Exception:
-        return dict(l) if isinstance(l, dict) else {}
+# ---------- Helpers: cosmetics & guards ----------
 
+# Trace types whose marker/line actually carry the encoded property; the
+# old hasattr() checks let e.g. marker.size through to bar/pie, which plotly rejects.
+_MARKER_SIZE_TYPES = {"scatter", "box"}
+_MARKER_COLOR_TYPES = {"scatter", "bar", "histogram", "box"}
+_LINE_SHAPE_TYPES = {"scatter"}
+_LINE_COLOR_TYPES = {"scatter", "box"}
 
-# --- replace your existing _apply_common with this version ---
-def _apply_common(trace: go.BaseTraceType, *, name_key: str, spec: VizSpec) -> None:
-    enc = spec.data.encodings
-    colors = spec.data.colors.color_map if (spec.data.colors and spec.data.colors.color_map) else None
+def _apply_common(trace: Dict[str, Any], *, name_key: str, ctx: _CompileCtx) -> None:
+    enc = ctx.enc
+    colors = ctx.colors
+    type_ = trace["type"]
 
     # Encodings: opacity, marker.size, line.shape
     if enc:
         if enc.opacity is not None:
-            trace.update(opacity=enc.opacity)
+            trace["opacity"] = enc.opacity
 
-        if hasattr(trace, "marker") and enc.marker_size is not None:
-            marker = _marker_json(trace)
-            marker.update(size=enc.marker_size)
-            trace.update(marker=marker)
+        if type_ in _MARKER_SIZE_TYPES and enc.marker_size is not None:
+            trace.setdefault("marker", {})["size"] = enc.marker_size
 
-        if hasattr(trace, "line") and enc.line_shape is not None:
-            line = _line_json(trace)
-            line.update(shape=enc.line_shape.value)
-            trace.update(line=line)
+        if type_ in _LINE_SHAPE_TYPES and enc.line_shape is not None:
+            trace.setdefault("line", {})["shape"] = enc.line_shape.value
 
     # Color mapping (applies to marker.color and/or line.color when present)
     if colors and name_key:
         col = colors.get(str(name_key))
         if col:
-            if hasattr(trace, "marker"):
-                marker = _marker_json(trace)
-                marker.update(color=col)
-                trace.update(marker=marker)
-            if hasattr(trace, "line"):
-                line = _line_json(trace)
-                line.update(color=col)
-                trace.update(line=line)
-
+            if type_ in _MARKER_COLOR_TYPES:
+                trace.setdefault("marker", {})["color"] = col
+            if type_ in _LINE_COLOR_TYPES:
+                trace.setdefault("line", {})["color"] = col
 
 
-def _route_axis(trace: go.BaseTraceType, *, ycol: Optional[str], spec: VizSpec) -> None:
-    y2_for = spec.data.axis.y2_for if (spec.data.axis and spec.data.axis.y2_for) else None
-    if y2_for and ycol in set(y2_for):
-        trace.update(yaxis="y2")
+def _route_axis(trace: Dict[str, Any], *, ycol: Optional[str], ctx: _CompileCtx) -> None:
+    if ycol in ctx.y2_set:
+        # horizontal bars carry their values on x, so the secondary axis is x2
+        if trace.get("orientation") == "h":
+            trace["xaxis"] = "x2"
+        else:
+            trace["yaxis"] = "y2"
 
 
-def _guard_traces(fig: go.Figure, *, max_traces: int) -> None:
-    count = len(fig.data)
+def _guard_traces(traces: List[Dict[str, Any]], *, max_traces: int) -> None:
+    count = len(traces)
     if count > max_traces:
         raise CompileError(f"trace count {count} exceeds limit {max_traces}")
 
 
-def _label_y(spec: VizSpec, ycol: Optional[str]) -> str:
+def _label_y(ctx: _CompileCtx, ycol: Optional[str]) -> str:
     if ycol is None:
         return ""
-    labels = spec.data.labels.y if (spec.data.labels and spec.data.labels.y) else {}
-    return str(labels.get(str(ycol), ycol))
+    return str(ctx.y_labels.get(str(ycol), ycol))
 
-def _label_series(spec: VizSpec, key: Any, *, fallback: str = "") -> str:
-    labels = spec.data.labels.series if (spec.data.labels and spec.data.labels.series) else {}
-    return str(labels.get(str(key), key)) if key is not None else fallback
+def _label_series(ctx: _CompileCtx, key: Any, *, fallback: str = "") -> str:
+    return str(ctx.series_labels.get(str(key), key)) if key is not None else fallback
 
 
 def _listify(v: Optional[Union[str, List[str]]]) -> List[str]:
@@ -409,6 +626,9 @@ def _listify(v: Optional[Union[str, List[str]]]) -> List[str]:
 
 
 def _ensure_columns(df: pd.DataFrame, cols: List[str]) -> None:
+    if not cols:
+        return
+    # df.columns' own hash lookup; set(df.columns) would be O(width) per call
     missing = [c for c in cols if c not in df.columns]
     if missing:
         raise CompileError(f"columns not found in dataframe: {missing}")